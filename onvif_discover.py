@@ -6,24 +6,91 @@ Descobre automaticamente dispositivos ONVIF na rede local via WS-Discovery (UDP
 Lista IPs, portas e informações básicas.
 """
 
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
 import socket
 import uuid
-import xml.etree.ElementTree as ET
 import re
 import sys
+import threading
+from io import BytesIO
+from logging.handlers import MemoryHandler
+
+try:
+    from lxml import etree as ET
+    HAVE_LXML = True
+except ImportError:  # lxml indisponível: cai para a stdlib
+    import xml.etree.ElementTree as ET
+    HAVE_LXML = False
+
+try:
+    import psutil  # enumeração das interfaces de rede (requirements.txt); sem ele, só o hostname
+except ImportError:
+    psutil = None
+
+log = logging.getLogger(__name__)
 
 # Configurações
 MULTICAST_GROUP = '239.255.255.250'
 PORT = 3702
 TIMEOUT = 5  # segundos de espera por respostas
+RECV_BUFSIZE = 65536  # maior datagrama UDP possível, arredondado
+RECV_BATCH = 16  # datagramas lidos por chamada de recvmmsg
+SO_RCVBUF_SIZE = 4 * 1024 * 1024  # evita descartes no kernel durante a janela de escuta
+IDLE_GAP = 0.8  # encerra antes do TIMEOUT se a rede ficar silenciosa por este tempo
+# LEVEL=debug no ambiente exibe os erros de recepção/parse de cada datagrama (ocultos por padrão)
+DEBUG = os.environ.get("LEVEL", "").lower() == "debug"
+
+# Namespaces usados nas respostas WS-Discovery
+NS = {
+    "e": "http://www.w3.org/2003/05/soap-envelope",
+    "a": "http://schemas.xmlsoap.org/ws/2004/08/addressing",
+    "d": "http://schemas.xmlsoap.org/ws/2005/04/discovery"
+}
+
+# Únicos elementos lidos da resposta: tag completa -> chave em info
+_EPR_TAG = "{%s}EndpointReference" % NS["a"]
+_ADDRESS_TAG = "{%s}Address" % NS["a"]
+_WANTED_TAGS = {
+    "{%s}Scopes" % NS["d"]: "Scopes",
+    "{%s}XAddrs" % NS["d"]: "XAddrs",
+    _EPR_TAG: "Address",  # só o Address do EndpointReference (não o de ReplyTo etc. no Header)
+}
+
+# Pré-varredura em bytes do EndpointReference/Address, para descartar duplicatas sem parse XML
+_ENDPOINT_RE = re.compile(rb"EndpointReference>\s*<(?:[\w.-]+:)?Address>\s*([^<\s]+)")
+
+# Configuração mínima do parser lxml: sem entidades, sem tabela de IDs, tolerante a erros
+_PARSER_OPTIONS = dict(
+    remove_blank_text=True,
+    resolve_entities=False,
+    collect_ids=False,
+    ns_clean=True,
+    recover=True,
+    huge_tree=False,
+)
+_parser_local = threading.local()
+
+# Campos extraídos de Scopes: um único padrão cobre todos (segmento do scope -> chave em info)
+_FIELD_MAP = {
+    "name": "Manufacturer",
+    "model": "Model",
+    "hardware": "Hardware",
+    "location": "Location",
+}
+_SCOPE_FIELDS_RE = re.compile(r"onvif://www\.onvif\.org/(name|model|hardware|location)/([^\s]+)")
 
-# Mensagem SOAP WS-Discovery (Probe)
-PROBE_MESSAGE = f"""<?xml version="1.0" encoding="utf-8"?>
+# Mensagem SOAP WS-Discovery (Probe); __MSGID__ é trocado por um UUID novo a cada envio
+PROBE_MESSAGE = """<?xml version="1.0" encoding="utf-8"?>
 <e:Envelope xmlns:e="http://www.w3.org/2003/05/soap-envelope"
             xmlns:w="http://schemas.xmlsoap.org/ws/2004/08/addressing"
             xmlns:d="http://schemas.xmlsoap.org/ws/2005/04/discovery">
   <e:Header>
-    <w:MessageID>uuid:{uuid.uuid4()}</w:MessageID>
+    <w:MessageID>uuid:__MSGID__</w:MessageID>
     <w:To>urn:schemas-xmlsoap-org:ws:2005:04:discovery</w:To>
     <w:Action>http://schemas.xmlsoap.org/ws/2005/04/discovery/Probe</w:Action>
   </e:Header>
@@ -34,75 +101,367 @@ PROBE_MESSAGE = f"""<?xml version="1.0" encoding="utf-8"?>
   </e:Body>
 </e:Envelope>
 """
+_PROBE_TMPL = PROBE_MESSAGE.encode("utf-8")
 
-def discover_onvif_devices(timeout=TIMEOUT):
-    """Envia Probe e coleta respostas WS-Discovery."""
-    results = []
+def _probe_payload():
+    """Probe pronto para envio, com MessageID único (exigido pelo WS-Discovery)."""
+    return _PROBE_TMPL.replace(b"__MSGID__", str(uuid.uuid4()).encode("ascii"))
+
+# recvmmsg(2): lê vários datagramas em uma única syscall (somente Linux/glibc)
+class _iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _sockaddr_in(ctypes.Structure):
+    _fields_ = [
+        ("sin_family", ctypes.c_ushort),
+        ("sin_port", ctypes.c_uint16),
+        ("sin_addr", ctypes.c_uint8 * 4),
+        ("sin_zero", ctypes.c_uint8 * 8),
+    ]
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _msghdr), ("msg_len", ctypes.c_uint)]
+
+def _load_recvmmsg():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fn = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    fn.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    fn.restype = ctypes.c_int
+    return fn
+
+_recvmmsg = _load_recvmmsg()
 
-    # Cria socket UDP
+class _BatchReceiver:
+    """Esvazia o socket (não bloqueante) em lotes de até RECV_BATCH datagramas.
+
+    No Linux usa recvmmsg com buffers pré-alocados; nos demais sistemas cai
+    para recvfrom_into repetido, sobre um único bytearray reaproveitado, até o
+    socket ficar vazio. Em ambos os casos cada datagrama sai como bytes do
+    tamanho exato recebido (o parse acontece depois, em outra thread).
+    """
+
+    def __init__(self, sock, vlen=RECV_BATCH):
+        self.sock = sock
+        self.vlen = vlen
+        if _recvmmsg is None:
+            self._buf = bytearray(RECV_BUFSIZE)
+            self._view = memoryview(self._buf)
+            return
+        self._bufs = [ctypes.create_string_buffer(RECV_BUFSIZE) for _ in range(vlen)]
+        self._addrs = (_sockaddr_in * vlen)()
+        self._iovs = (_iovec * vlen)()
+        self._msgs = (_mmsghdr * vlen)()
+        for i in range(vlen):
+            self._iovs[i].iov_base = ctypes.addressof(self._bufs[i])
+            self._iovs[i].iov_len = RECV_BUFSIZE
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._addrs[i])
+            hdr.msg_iov = ctypes.pointer(self._iovs[i])
+            hdr.msg_iovlen = 1
+
+    def recv(self):
+        """Retorna lista de (data, addr) com o que já estiver na fila do socket."""
+        if _recvmmsg is None:
+            return self._recv_fallback()
+
+        for i in range(self.vlen):
+            self._msgs[i].msg_hdr.msg_namelen = ctypes.sizeof(_sockaddr_in)
+        n = _recvmmsg(self.sock.fileno(), self._msgs, self.vlen, socket.MSG_DONTWAIT, None)
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(err, os.strerror(err))
+
+        batch = []
+        for i in range(n):
+            sa = self._addrs[i]
+            addr = (socket.inet_ntoa(bytes(sa.sin_addr)), socket.ntohs(sa.sin_port))
+            batch.append((ctypes.string_at(self._bufs[i], self._msgs[i].msg_len), addr))
+        return batch
+
+    def _recv_fallback(self):
+        batch = []
+        while len(batch) < self.vlen:
+            try:
+                n, addr = self.sock.recvfrom_into(self._buf, RECV_BUFSIZE)
+            except (BlockingIOError, InterruptedError):
+                break
+            batch.append((bytes(self._view[:n]), addr))
+        return batch
+
+def _local_ipv4_addresses():
+    """IPv4 das interfaces locais (sem loopback); lista vazia se não for possível descobrir."""
+    if psutil is not None:
+        addrs = [a.address for nic in psutil.net_if_addrs().values() for a in nic
+                 if a.family == socket.AF_INET]
+    else:
+        try:
+            addrs = socket.gethostbyname_ex(socket.gethostname())[2]
+        except OSError:
+            addrs = []
+    return sorted({a for a in addrs if not a.startswith("127.")})
+
+def _open_probe_socket(iface_addr=None):
+    """Cria socket UDP não bloqueante; se iface_addr for dado, o multicast sai por essa interface."""
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.settimeout(timeout)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
-        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
-    except Exception:
-        pass
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SO_RCVBUF_SIZE)
+        except OSError:
+            pass
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+        except Exception:
+            pass
+        if iface_addr:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(iface_addr))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+class ProbeProto(asyncio.DatagramProtocol):
+    """Recebe respostas WS-Discovery de um socket de probe.
+
+    datagram_received só descarta duplicatas e agenda o parse do XML no executor,
+    de modo que a recepção nunca espera pelo parse. Uma instância por socket,
+    todas compartilhando o mesmo estado da rodada (seen/pending/activity).
+
+    Um endpoint só entra em seen depois que uma resposta dele foi parseada por
+    completo: um datagrama truncado não impede que a resposta boa seguinte seja lida.
+    """
+
+    def __init__(self, loop, seen, pending, activity):
+        self.loop = loop
+        self.seen = seen  # EndpointReference/Address com resposta completa (o mesmo device responde por várias interfaces)
+        self.pending = pending  # futures de parse, na ordem de chegada
+        self.activity = activity  # sinaliza chegada de resposta (para o IDLE_GAP)
+
+    def datagram_received(self, data, addr):
+        endpoint = _endpoint_address(data)
+        if endpoint and endpoint in self.seen:
+            return
+        fut = self.loop.run_in_executor(None, _parse_and_tag, data, addr)
+        if endpoint:
+            fut.add_done_callback(lambda f: self._mark_seen(endpoint, f))
+        self.pending.append(fut)
+        self.activity.set()
 
-    print(f"[+] Enviando Probe ONVIF para {MULTICAST_GROUP}:{PORT} ...")
-    sock.sendto(PROBE_MESSAGE.encode("utf-8"), (MULTICAST_GROUP, PORT))
+    def _mark_seen(self, endpoint, fut):
+        if not fut.cancelled() and _is_complete(fut.result()):
+            self.seen.add(endpoint)
 
-    print(f"[+] Aguardando respostas por {timeout} segundos...\n")
+    def error_received(self, exc):
+        log.debug("[!] Erro ao receber resposta: %s", exc)
 
-    while True:
+def _parse_and_tag(data, addr):
+    """Executado no executor: parse da resposta + IP de origem; None se falhar."""
+    try:
+        device_info = parse_probe_response(data)
+        if "error" in device_info:
+            log.debug("[!] Erro ao processar resposta de %s: %s", addr[0], device_info["error"])
+        device_info["from"] = addr[0]
+        return device_info
+    except Exception as e:
+        log.debug("[!] Erro ao processar resposta: %s", e)
+        return None
+
+def _is_complete(info):
+    """True se a resposta foi parseada sem erro e trouxe ao menos um XAddr."""
+    return bool(info) and "error" not in info and bool(info["XAddrs"])
+
+def _dedup_results(results):
+    """Uma entrada por EndpointReference/Address, na ordem de chegada.
+
+    Respostas parseadas em paralelo antes de o endpoint entrar em seen podem se
+    repetir; vale a primeira completa, e as incompletas de um endpoint que também
+    respondeu por completo são descartadas.
+    """
+    complete = {r["Address"] for r in results if r.get("Address") and _is_complete(r)}
+    kept, out = set(), []
+    for r in results:
+        endpoint = r.get("Address")
+        if endpoint:
+            if endpoint in kept or (endpoint in complete and not _is_complete(r)):
+                continue
+            kept.add(endpoint)
+        out.append(r)
+    return out
+
+def _drain(receiver, proto):
+    """Callback de leitura: esvazia o socket em lote e entrega cada datagrama ao protocolo."""
+    try:
+        batch = receiver.recv()
+    except OSError as e:
+        proto.error_received(e)
+        return
+    for data, addr in batch:
+        proto.datagram_received(data, addr)
+
+async def _discover(timeout):
+    loop = asyncio.get_running_loop()
+    seen, pending, activity = set(), [], asyncio.Event()
+
+    # Um socket por interface, todos atendidos pelo mesmo event loop
+    socks = []
+    ifaces = _local_ipv4_addresses()
+    if not ifaces:
+        log.info("[+] Nenhuma interface IPv4 encontrada%s; Probe só pela interface padrão",
+                 "" if psutil is not None else " (psutil não instalado)")
+    for iface in ifaces or [None]:
         try:
-            data, addr = sock.recvfrom(65507)
-            xml_data = data.decode(errors="ignore")
-            device_info = parse_probe_response(xml_data)
-            device_info["from"] = addr[0]
-            results.append(device_info)
-        except socket.timeout:
-            break
-        except Exception as e:
-            print(f"[!] Erro ao processar resposta: {e}")
+            sock = _open_probe_socket(iface)
+            log.info("[+] Enviando Probe ONVIF para %s:%s via %s ...", MULTICAST_GROUP, PORT, iface or "interface padrão")
+            sock.sendto(_probe_payload(), (MULTICAST_GROUP, PORT))
+        except OSError as e:
+            log.warning("[!] Falha ao enviar Probe via %s: %s", iface or "interface padrão", e)
             continue
+        socks.append(sock)
+
+    if not socks:
+        return []
+
+    readers, transports = [], []
+    try:
+        for sock in socks:
+            proto = ProbeProto(loop, seen, pending, activity)
+            try:
+                # leitura própria em lote (recvmmsg) quando o loop aceita add_reader...
+                loop.add_reader(sock.fileno(), _drain, _BatchReceiver(sock), proto)
+                readers.append(sock.fileno())
+            except NotImplementedError:
+                # ...senão (ProactorEventLoop no Windows) o transport do asyncio lê um a um
+                transport, _ = await loop.create_datagram_endpoint(lambda: proto, sock=sock)
+                transports.append(transport)
+
+        log.info("[+] Aguardando respostas por até %s segundos...\n", timeout)
+
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            activity.clear()
+            try:
+                await asyncio.wait_for(activity.wait(), min(remaining, IDLE_GAP))
+            except asyncio.TimeoutError:
+                # silêncio por IDLE_GAP: se alguém já respondeu, não há por que esperar o resto
+                if pending:
+                    break
+    finally:
+        for fd in readers:
+            loop.remove_reader(fd)
+        for transport in transports:
+            transport.close()
+        for sock in socks:
+            sock.close()
 
-    sock.close()
-    return results
+    results = await asyncio.gather(*pending)
+    return _dedup_results([r for r in results if r is not None])
 
-def parse_probe_response(xml_data):
-    """Extrai informações úteis de uma resposta WS-Discovery."""
+def discover_onvif_devices(timeout=TIMEOUT):
+    """Envia Probe por cada interface IPv4 e coleta respostas WS-Discovery de todas."""
+    return asyncio.run(_discover(timeout))
+
+def _endpoint_address(data):
+    """EndpointReference/Address da resposta via busca direta nos bytes (sem parse), ou None."""
+    m = _ENDPOINT_RE.search(data)
+    return m.group(1).decode("utf-8", errors="replace") if m else None
+
+def parse_probe_response(data):
+    """Extrai informações úteis de uma resposta WS-Discovery (bytes crus do datagrama)."""
     info = {"Scopes": [], "XAddrs": []}
     try:
-        ns = {
-            "e": "http://www.w3.org/2003/05/soap-envelope",
-            "a": "http://schemas.xmlsoap.org/ws/2004/08/addressing",
-            "d": "http://schemas.xmlsoap.org/ws/2005/04/discovery"
-        }
-        root = ET.fromstring(xml_data)
-
-        scopes = root.findall(".//d:Scopes", ns)
-        for s in scopes:
-            txt = s.text or ""
-            info["Scopes"].append(txt.strip())
-
-        xaddrs = root.findall(".//d:XAddrs", ns)
-        for x in xaddrs:
-            info["XAddrs"].append(x.text.strip())
+        for field, txt in _iter_wanted(data):
+            if field == "Address":
+                info.setdefault("Address", txt.strip())
+            else:
+                info[field].append(txt.strip())
 
         # Extrair manufacturer/model/serial de Scopes se possível
-        all_scopes = " ".join(info["Scopes"])
-        info["Manufacturer"] = extract_scope_field(all_scopes, "onvif://www.onvif.org/name")
-        info["Model"] = extract_scope_field(all_scopes, "onvif://www.onvif.org/model")
-        info["Hardware"] = extract_scope_field(all_scopes, "onvif://www.onvif.org/hardware")
-        info["Location"] = extract_scope_field(all_scopes, "onvif://www.onvif.org/location")
+        info.update(extract_scope_fields(info["Scopes"]))
     except Exception as e:
         info["error"] = str(e)
     return info
 
-def extract_scope_field(scope_str, key):
-    """Busca valor de um campo dentro de Scopes (ex: onvif://www.onvif.org/model/ABC123)."""
-    m = re.search(re.escape(key) + r"/([^ ]+)", scope_str)
-    return m.group(1) if m else None
+def _pull_parser():
+    """XMLPullParser (lxml) da thread atual, criado uma vez e reaproveitado a cada datagrama."""
+    parser = getattr(_parser_local, "parser", None)
+    if parser is None:
+        parser = _parser_local.parser = ET.XMLPullParser(
+            events=("end",), tag=tuple(_WANTED_TAGS), **_PARSER_OPTIONS)
+    return parser
+
+def _elem_text(elem):
+    """Texto de um elemento de _WANTED_TAGS; no EndpointReference, o do filho Address."""
+    if elem.tag == _EPR_TAG:
+        return elem.findtext(_ADDRESS_TAG) or ""
+    return elem.text or ""
+
+def _iter_wanted(data):
+    """Percorre a resposta em streaming, gerando (campo, texto) só para _WANTED_TAGS.
+
+    Cada elemento é liberado logo após a leitura, sem montar a árvore inteira.
+    """
+    if not HAVE_LXML:
+        for _, elem in ET.iterparse(BytesIO(data), events=("end",)):
+            field = _WANTED_TAGS.get(elem.tag)
+            if field is not None:
+                yield field, _elem_text(elem)
+                elem.clear()
+        return
+
+    parser = _pull_parser()
+    try:
+        # bytes direto: o parser detecta o encoding pela declaração XML
+        parser.feed(data)
+        # encerra o documento antes de ler: com recover=True, elementos deixados
+        # abertos por um datagrama truncado só geram evento no close()
+        parser.close()
+    finally:
+        # esvazia a fila mesmo em caso de erro, para nada vazar para o próximo datagrama
+        events = list(parser.read_events())
+
+    for _, elem in events:
+        yield _WANTED_TAGS[elem.tag], _elem_text(elem)
+        elem.clear()
+        # descarta irmãos já processados que ainda ficaram pendurados no pai
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+def extract_scope_fields(scopes):
+    """Extrai Manufacturer/Model/Hardware/Location da lista de Scopes (ex: onvif://www.onvif.org/model/ABC123).
+
+    Varre cada entrada de Scopes sem concatená-las e para assim que os quatro
+    campos forem encontrados; vale a primeira ocorrência de cada campo e
+    campos ausentes ficam como None.
+    """
+    found = {}
+    for scope_str in scopes:
+        for m in _SCOPE_FIELDS_RE.finditer(scope_str):
+            found.setdefault(m.group(1), m.group(2))
+        if len(found) == len(_FIELD_MAP):
+            break
+    return {field: found.get(key) for key, field in _FIELD_MAP.items()}
 
 def print_results(devices):
     if not devices:
@@ -127,11 +486,32 @@ def print_results(devices):
             print(f"Scopes          : {dev['Scopes']}")
         print()
 
+def setup_logging(level=None):
+    """Log no stdout via MemoryHandler.
+
+    Por padrão o nível é INFO e os erros por datagrama (debug) não são exibidos.
+    Com LEVEL=debug eles ficam em buffer durante a recepção e são escritos em
+    lote; a partir de INFO o buffer é descarregado na hora, junto com a mensagem.
+    """
+    if level is None:
+        level = logging.DEBUG if DEBUG else logging.INFO
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter("%(message)s"))
+    root = logging.getLogger()
+    root.addHandler(MemoryHandler(capacity=1024, flushLevel=logging.INFO, target=stream))
+    root.setLevel(logging.INFO)
+    # debug só deste script (não de asyncio etc.)
+    log.setLevel(level)
+
 def main():
     devices = discover_onvif_devices()
+    # descarrega o que ficou em buffer antes da listagem final
+    for handler in logging.getLogger().handlers:
+        handler.flush()
     print_results(devices)
 
 if __name__ == "__main__":
+    setup_logging()
     try:
         main()
     except KeyboardInterrupt:
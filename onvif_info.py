@@ -6,10 +6,24 @@ Altere IP/PORT/USER/PASS abaixo conforme necessário.
 """
 
 import json
+import logging
+import os
 import sys
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from onvif import ONVIFCamera
+from requests import Session
+from requests.adapters import HTTPAdapter
+from zeep.cache import SqliteCache
 from zeep.helpers import serialize_object
+from zeep.transports import Transport
+
+try:
+    import orjson  # opcional: serializador JSON em C, bem mais rápido para o arquivo de saída
+except ImportError:
+    orjson = None
+
+log = logging.getLogger(__name__)
 
 # CONFIGURAÇÃO
 IP = "192.168.1.68"
@@ -21,6 +35,9 @@ PASSWORD = ""   # coloque senha (se houver)
 WSDL_DIR = None  # None => usa WSDL internos do package, ou caminho: '/path/to/wsdl/'
 
 OUTPUT_JSON = f'onvif_info_{IP}.json'
+MAX_WORKERS = 16  # serviços atendidos em paralelo (e tamanho do pool HTTP)
+# LEVEL=debug no ambiente inclui a traceback completa nos erros de etapa (connect, GetServices, ...)
+DEBUG = os.environ.get("LEVEL", "").lower() == "debug"
 
 # Lista de chamadas a tentar (serviços + métodos)
 SERVICE_METHODS = {
@@ -55,6 +72,20 @@ SERVICE_METHODS = {
     # ... outros serviços podem ser adicionados
 }
 
+def make_transport():
+    """Transport zeep compartilhado por todos os serviços da câmera.
+
+    Uma única Session com keep-alive (pool do tamanho de MAX_WORKERS) evita abrir
+    uma conexão TCP por chamada SOAP; o SqliteCache guarda em disco os documentos
+    WSDL/XSD baixados, reaproveitados entre execuções.
+    """
+    session = Session()
+    session.headers.update({"Connection": "keep-alive"})
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return Transport(session=session, cache=SqliteCache())
+
 def safe_call(service, method_name, args=None):
     """Chama método SOAP de forma segura, sérializando resultado quando possível."""
     args = args or {}
@@ -66,32 +97,126 @@ def safe_call(service, method_name, args=None):
         res = method(**args) if args else method()
         return {"result": serialize_obj(res)}
     except Exception as e:
-        tb = traceback.format_exc()
-        return {"error": str(e), "traceback": tb}
+        # guarda a exceção; a traceback só é formatada se chegar ao JSON (ver _fmt_exc)
+        return {"error": str(e), "traceback": e}
+
+def stage_error(stage, e):
+    """Entrada para summary["errors"]; a exceção (formatada só no dump) vai junto apenas com LEVEL=debug."""
+    entry = {"stage": stage, "error": str(e)}
+    if DEBUG:
+        entry["traceback"] = e
+    return entry
+
+def _fmt_exc(o):
+    """default= do json.dump: formata traceback de exceções guardadas, str() para o resto."""
+    if isinstance(o, BaseException):
+        return "".join(traceback.format_exception(type(o), o, o.__traceback__))
+    return str(o)
+
+_TOKEN_KEYS = ("token", "@token", "Token")
+_SOURCE_TOKEN_KEYS = ("SourceToken", "Token")
+
+def _as_list(profiles):
+    """Normaliza o resultado de GetProfiles (lista, dict com "Profile" ou dict único) em lista."""
+    if isinstance(profiles, dict):
+        profiles = profiles.get("Profile", profiles)
+    if isinstance(profiles, dict):
+        return [profiles]
+    return profiles if isinstance(profiles, list) else []
+
+def _first_key(d, keys):
+    """Valor (não vazio) da primeira chave de keys presente em d, ou None."""
+    if not isinstance(d, dict):
+        return None
+    return next((d[k] for k in keys if d.get(k)), None)
+
+def _walk_source_tokens(profiles):
+    """VideoSourceTokens dos profiles: Profile -> VideoSourceConfiguration -> SourceToken."""
+    return [tok for p in profiles
+            if isinstance(p, dict) and (tok := _first_key(p.get("VideoSourceConfiguration"), _SOURCE_TOKEN_KEYS))]
+
+def _call_serially(service, calls):
+    """safe_call de cada (método, args) de calls, em série no mesmo serviço; lista de resultados."""
+    return [safe_call(service, method, args) for method, args in calls]
+
+def _get_stream_uris(media, profile_tokens):
+    """GetStreamUri (RTSP) de cada profile, em série; erro vira dict, como em safe_call."""
+    stream_map = {}
+    for token in profile_tokens:
+        req = {'StreamSetup': {'Stream': 'RTP-Unicast', 'Transport': {'Protocol': 'RTSP'}}, 'ProfileToken': token}
+        try:
+            stream_map[token] = serialize_obj(media.GetStreamUri(req))
+        except Exception as e:
+            stream_map[token] = {"error": str(e), "traceback": e}
+    return stream_map
+
+def dump_json(obj, path):
+    """Grava obj em path como JSON indentado (UTF-8), via orjson quando instalado.
+
+    Serializa antes de abrir o arquivo: uma falha não deixa um arquivo anterior truncado.
+    Datas passam pelo mesmo default (str()) nos dois caminhos, e o que o orjson não
+    aceita (ex.: inteiros acima de 64 bits) cai para o json da stdlib.
+    """
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj, default=_fmt_exc,
+                                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:  # orjson.JSONEncodeError é subclasse de TypeError
+            pass
+        else:
+            with open(path, "wb") as f:
+                f.write(data)
+            return
+
+    data = json.dumps(obj, indent=2, ensure_ascii=False, default=_fmt_exc)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data)
+
+_SIMPLE = (str, int, float, bool, type(None))
+
+def _is_pure(obj):
+    """True se obj já é JSON nativo (dict/list/tuple de tipos simples, recursivamente)."""
+    if isinstance(obj, _SIMPLE):
+        return True
+    if isinstance(obj, dict):
+        return all(isinstance(k, str) and _is_pure(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return all(_is_pure(v) for v in obj)
+    return False
+
+def _to_native(obj):
+    """Converte recursivamente para tipos JSON; folhas desconhecidas viram str()."""
+    if isinstance(obj, _SIMPLE):
+        return obj
+    if isinstance(obj, dict):
+        return {str(k): _to_native(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_native(v) for v in obj]
+    return str(obj)
 
 def serialize_obj(obj):
     """Tenta serializar objeto zeep ou retorná-lo se simples."""
+    if _is_pure(obj):
+        return obj
     try:
+        # objetos zeep (CompoundValue/AnyObject e listas deles)
         return serialize_object(obj)
     except Exception:
-        try:
-            # fallback para JSON-serializable
-            return json.loads(json.dumps(obj, default=lambda o: str(o)))
-        except Exception:
-            return str(obj)
+        return _to_native(obj)
 
 def main():
     summary = {"target": f"{IP}:{PORT}", "services": {}, "errors": []}
     device_service_url = f"http://{IP}:{PORT}/onvif/device_service"
     try:
-        # Cria cliente ONVIF
+        # Cria cliente ONVIF; todos os serviços criados a partir dele usam o mesmo transport
+        transport = make_transport()
         if WSDL_DIR:
-            cam = ONVIFCamera(IP, PORT, USERNAME, PASSWORD, wsdl_dir=WSDL_DIR)
+            cam = ONVIFCamera(IP, PORT, USERNAME, PASSWORD, wsdl_dir=WSDL_DIR, transport=transport)
         else:
-            cam = ONVIFCamera(IP, PORT, USERNAME, PASSWORD)
+            cam = ONVIFCamera(IP, PORT, USERNAME, PASSWORD, transport=transport)
     except Exception as e:
-        summary["errors"].append({"stage": "connect", "error": str(e), "traceback": traceback.format_exc()})
-        print("Erro ao criar ONVIFCamera:", e)
+        summary["errors"].append(stage_error("connect", e))
+        log.error("Erro ao criar ONVIFCamera: %s", e)
         save_and_exit(summary)
 
     # Tenta listar serviços disponíveis (GetServices)
@@ -100,7 +225,7 @@ def main():
         gsv = safe_call(dev_service, "GetServices", {"IncludeCapability": True})
         summary["services"]["device_GetServices"] = gsv
     except Exception as e:
-        summary["errors"].append({"stage": "get_services", "error": str(e), "traceback": traceback.format_exc()})
+        summary["errors"].append(stage_error("get_services", e))
 
     # Itera pelas services conhecidas e tenta chamar métodos padrão
     # Nota: para serviços como media/imaging/ptz precisamos instanciar via cam.create_<service>()
@@ -117,113 +242,78 @@ def main():
     # guarda tokens/profile info para usar em chamadas que requerem token
     context = {"profiles": [], "video_source_tokens": []}
 
-    for svc_name, calls in SERVICE_METHODS.items():
-        svc_result = {}
+    # Instancia os serviços (cada um carrega seu WSDL) antes de disparar as chamadas
+    services = {}
+    for svc_name in SERVICE_METHODS:
         if svc_name not in service_creators:
-            svc_result["note"] = "serviço não implementado no script"
-            summary["services"][svc_name] = svc_result
+            summary["services"][svc_name] = {"note": "serviço não implementado no script"}
             continue
+        try:
+            services[svc_name] = service_creators[svc_name]()
+        except Exception as e:
+            summary["services"][svc_name] = {
+                "error": f"falha ao criar serviço {svc_name}: {str(e)}",
+                "traceback": e,
+            }
+
+    # resultados por serviço, já na ordem de SERVICE_METHODS (preenchidos conforme as chamadas terminam)
+    results = {svc_name: {method: None for method, _ in SERVICE_METHODS[svc_name]} for svc_name in services}
+
+    # As chamadas SOAP são dominadas pela latência de rede: os serviços rodam em paralelo.
+    # Dentro de um mesmo serviço as chamadas seguem em série: o UsernameToken do
+    # ONVIFService (UsernameDigestTokenDtDiff.apply) altera e restaura `created` sem
+    # lock, e chamadas simultâneas o deixariam preso num timestamp antigo.
+    # GetImagingSettings e GetStreamUri dependem dos tokens de media/GetProfiles,
+    # então ficam para uma segunda leva, depois que a primeira termina.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as exe:
+        futures = {}
+        for svc_name, service in services.items():
+            calls = [(method, args) for method, args in SERVICE_METHODS[svc_name]
+                     if not (svc_name == "imaging" and method == "GetImagingSettings")]
+            futures[exe.submit(_call_serially, service, calls)] = (svc_name, calls)
+        for fut in as_completed(futures):
+            svc_name, calls = futures[fut]
+            for (method, _), out in zip(calls, fut.result()):
+                results[svc_name][method] = out
 
+        # extrair tokens dos profiles (profile e VideoSource)
+        out = results.get("media", {}).get("GetProfiles") or {}
+        profiles = _as_list(out.get("result"))
+        context["profiles"] = [tok for p in profiles if (tok := _first_key(p, _TOKEN_KEYS))]
+        context["video_source_tokens"] = _walk_source_tokens(profiles)
+
+        # segunda leva: GetImagingSettings requer VideoSourceToken
+        imaging_future = None
+        if "imaging" in results and "GetImagingSettings" in results["imaging"]:
+            tokens = context["video_source_tokens"]
+            if tokens:
+                calls = [("GetImagingSettings", {"VideoSourceToken": t}) for t in tokens]
+                imaging_future = exe.submit(_call_serially, services["imaging"], calls)
+            else:
+                # marcar que não havia token
+                results["imaging"]["GetImagingSettings"] = {"note": "requer VideoSourceToken; não encontrado automaticamente"}
+
+        # Chamadas extra úteis: GetStreamUri para cada profile
+        stream_future = None
         try:
-            service = service_creators[svc_name]()
+            if context.get("profiles"):
+                # reaproveita o cliente media da primeira leva (já livre); só cria se faltar
+                media = services.get("media") or cam.create_media_service()
+                stream_future = exe.submit(_get_stream_uris, media, context["profiles"])
         except Exception as e:
-            svc_result["error"] = f"falha ao criar serviço {svc_name}: {str(e)}"
-            svc_result["traceback"] = traceback.format_exc()
-            summary["services"][svc_name] = svc_result
-            continue
+            summary["errors"].append(stage_error("GetStreamUri", e))
 
-        for method, args in calls:
-            # Chamadas especiais: se método precisa de tokens, tentamos preencher
-            if svc_name == "media" and method == "GetProfiles":
-                out = safe_call(service, method, args)
-                svc_result[method] = out
-                # extrair profiles
-                try:
-                    profiles = out.get("result") or out.get("result", [])
-                    # profiles podem já estar em lista ou dict
-                    if isinstance(profiles, dict) and "Profile" in profiles:
-                        profiles = profiles["Profile"]
-                except Exception:
-                    profiles = []
-                # normalize profiles list
-                if isinstance(profiles, dict):
-                    profiles = [profiles]
-                if isinstance(profiles, list):
-                    tokens = []
-                    for p in profiles:
-                        t = None
-                        try:
-                            t = p.get("token") or p.get("@token") or p.get("token", None)
-                        except Exception:
-                            pass
-                        if t:
-                            tokens.append(t)
-                    context["profiles"] = tokens
-                continue
-
-            if svc_name == "imaging" and method == "GetImagingSettings":
-                # requer VideoSourceToken; tentamos usar profiles -> videoSourceToken ou tentar GetVideoSources
-                tokens = context.get("video_source_tokens", [])
-                if not tokens:
-                    # tenta extrair de perfis media: cada profile pode ter VideoSourceConfiguration / SourceToken
-                    # vamos tentar obter videoSourceToken a partir do media profiles stored earlier
-                    # (as informações podem estar em summary["services"]["media_GetProfiles"])
-                    med = summary["services"].get("media_GetProfiles", {})
-                    profiles_data = med.get("result") if med else None
-                    if profiles_data:
-                        try:
-                            # profiles_data pode ter keys; navegar
-                            p_list = profiles_data if isinstance(profiles_data, list) else (profiles_data.get("Profile") if isinstance(profiles_data, dict) else [])
-                            if isinstance(p_list, dict):
-                                p_list = [p_list]
-                            for p in p_list:
-                                vs_token = None
-                                # caminhos possíveis
-                                if isinstance(p, dict):
-                                    # Profile -> VideoSourceConfiguration -> SourceToken
-                                    try:
-                                        vsc = p.get("VideoSourceConfiguration") or p.get("VideoSourceConfiguration", {})
-                                        vs_token = vsc.get("SourceToken") or vsc.get("Token")
-                                    except Exception:
-                                        pass
-                                    # ou Profile -> videoSourceConfiguration -> sourceToken
-                                if vs_token:
-                                    tokens.append(vs_token)
-                        except Exception:
-                            pass
-                if tokens:
-                    svc_result[method] = []
-                    for t in tokens:
-                        out = safe_call(service, method, {"VideoSourceToken": t})
-                        svc_result[method].append({t: out})
-                    summary["services"][svc_name] = svc_result
-                    continue
-                else:
-                    # marcar que não havia token
-                    svc_result[method] = {"note": "requer VideoSourceToken; não encontrado automaticamente"}
-                    summary["services"][svc_name] = svc_result
-                    continue
-
-            # default call
-            out = safe_call(service, method, args)
-            svc_result[method] = out
-
-        summary["services"][svc_name] = svc_result
-
-    # Chamadas extra úteis: GetStreamUri para cada profile
-    try:
-        if context.get("profiles"):
-            media = cam.create_media_service()
-            stream_map = {}
-            for token in context["profiles"]:
-                try:
-                    uri_resp = media.GetStreamUri({'StreamSetup': {'Stream': 'RTP-Unicast', 'Transport': {'Protocol': 'RTSP'}}, 'ProfileToken': token})
-                    stream_map[token] = serialize_obj(uri_resp)
-                except Exception as e:
-                    stream_map[token] = {"error": str(e), "traceback": traceback.format_exc()}
-            summary["stream_uris"] = stream_map
-    except Exception as e:
-        summary["errors"].append({"stage": "GetStreamUri", "error": str(e), "traceback": traceback.format_exc()})
+        if imaging_future is not None:
+            results["imaging"]["GetImagingSettings"] = [{t: out} for t, out in zip(tokens, imaging_future.result())]
+        if stream_future is not None:
+            summary["stream_uris"] = stream_future.result()
+
+    # mantém a ordem de SERVICE_METHODS no resumo
+    for svc_name in SERVICE_METHODS:
+        if svc_name in results:
+            summary["services"][svc_name] = results[svc_name]
+        else:
+            summary["services"][svc_name] = summary["services"].pop(svc_name)
 
     # tenta obter certificados/firmware se disponível em GetDeviceInformation result (Manufacturer/Model/FirmwareVersion/SerialNumber/HardwareId)
     try:
@@ -234,12 +324,10 @@ def main():
 
     # salva em JSON
     try:
-        with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-            #json.dump(summary, f, indent=2, ensure_ascii=False)
-            json.dump(summary, f, indent=2, ensure_ascii=False, default=str)
-        print(f"Resultado salvo em {OUTPUT_JSON}")
+        dump_json(summary, OUTPUT_JSON)
+        log.info("Resultado salvo em %s", OUTPUT_JSON)
     except Exception as e:
-        print("Erro ao salvar JSON:", e)
+        log.error("Erro ao salvar JSON: %s", e)
 
     # imprime resumo sucinto na tela
     print(json.dumps({
@@ -250,12 +338,26 @@ def main():
 
 def save_and_exit(summary):
     try:
-        with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-            json.dump(summary, f, indent=2, ensure_ascii=False)
-        print(f"Saída parcial gravada em {OUTPUT_JSON}")
+        dump_json(summary, OUTPUT_JSON)
+        log.info("Saída parcial gravada em %s", OUTPUT_JSON)
     except Exception:
         pass
     sys.exit(1)
 
+def setup_logging():
+    """Mensagens deste script em stdout, texto puro.
+
+    Handler próprio e propagate=False: o pacote onvif já chama logging.basicConfig
+    (stderr) ao ser importado, então configurar o root aqui não teria efeito.
+    """
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(stream)
+    log.propagate = False
+    # LEVEL=debug vale só para este script: no root, zeep/urllib3 despejariam cada
+    # requisição SOAP (com o UsernameToken do WS-Security) na saída
+    log.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+
 if __name__ == "__main__":
+    setup_logging()
     main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Testes de regressão do parse de respostas WS-Discovery (onvif_discover.py)."""
+
+import asyncio
+
+from onvif_discover import ProbeProto, _dedup_results, _endpoint_address, parse_probe_response
+
+RESPONSE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://www.w3.org/2003/05/soap-envelope"
+    xmlns:wsa="http://schemas.xmlsoap.org/ws/2004/08/addressing"
+    xmlns:d="http://schemas.xmlsoap.org/ws/2005/04/discovery">
+  <SOAP-ENV:Header>
+    <wsa:MessageID>uuid:11111111-1111-1111-1111-111111111111</wsa:MessageID>
+    <wsa:ReplyTo><wsa:Address>http://schemas.xmlsoap.org/ws/2004/08/addressing/role/anonymous</wsa:Address></wsa:ReplyTo>
+  </SOAP-ENV:Header>
+  <SOAP-ENV:Body>
+    <d:ProbeMatches>
+      <d:ProbeMatch>
+        <wsa:EndpointReference><wsa:Address>urn:uuid:__DEV__</wsa:Address></wsa:EndpointReference>
+        <d:Scopes>onvif://www.onvif.org/name/__DEV__ onvif://www.onvif.org/model/X100</d:Scopes>
+        <d:XAddrs>http://192.168.1.68:8899/onvif/device_service</d:XAddrs>
+      </d:ProbeMatch>
+    </d:ProbeMatches>
+  </SOAP-ENV:Body>
+</SOAP-ENV:Envelope>
+"""
+
+def response_for(dev):
+    return RESPONSE.replace(b"__DEV__", dev.encode("ascii"))
+
+def test_truncated_datagram_does_not_leak_into_next():
+    truncated = response_for("ACME")
+    truncated = truncated[:truncated.index(b"onvif://www.onvif.org/model")]
+    parse_probe_response(truncated)
+
+    info = parse_probe_response(response_for("DEV2"))
+    assert info["Scopes"] == ["onvif://www.onvif.org/name/DEV2 onvif://www.onvif.org/model/X100"]
+    assert info["Manufacturer"] == "DEV2"
+    assert info["Address"] == "urn:uuid:DEV2"
+
+def test_endpoint_address_ignores_header_reply_to():
+    assert _endpoint_address(response_for("DEV1")) == "urn:uuid:DEV1"
+    assert _endpoint_address(response_for("DEV2")) == "urn:uuid:DEV2"
+    assert parse_probe_response(response_for("DEV1"))["Address"] == "urn:uuid:DEV1"
+
+def test_truncated_reply_does_not_hide_later_good_reply():
+    good = response_for("DEV1")
+    truncated = good[:good.index(b"<d:XAddrs>")]
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        seen, pending = set(), []
+        proto = ProbeProto(loop, seen, pending, asyncio.Event())
+        for data in (truncated, good, good):
+            proto.datagram_received(data, ("192.168.1.68", 3702))
+            await asyncio.gather(*pending)
+        return _dedup_results(await asyncio.gather(*pending))
+
+    devices = asyncio.run(run())
+    assert len(devices) == 1
+    assert devices[0]["XAddrs"] == ["http://192.168.1.68:8899/onvif/device_service"]